@@ -0,0 +1,91 @@
+"""Compiled kernels that compute the force between every pair of bodies exactly."""
+
+import functools
+import math
+
+import numpy as np
+from numba import njit, prange
+
+
+def compute_forces(pos, mass, G, soft2, force):
+    """Writes the force applied to each body by every other body into `force`, with
+    the squared distance between each pair softened by `soft2`.
+
+    Every array and scalar must be `np.float32`; the kernel's own constants are too,
+    so that nothing is promoted to double precision.
+    """
+    # The kernel reads the coordinates from separate contiguous arrays, so that the
+    # same coordinate of consecutive bodies is adjacent in memory and can be loaded
+    # into a SIMD register at once.
+    x = np.ascontiguousarray(pos[:, 0])
+    y = np.ascontiguousarray(pos[:, 1])
+    _compute_forces(x, y, mass, G, soft2, force)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _compute_forces(x, y, mass, G, soft2, force):
+    # By Newton's third law each pair could be computed once and applied to both
+    # bodies, but writing to body j from the inner loop stops it being vectorized.
+    # Summing every body's row in full does twice the arithmetic, but on eight or
+    # more pairs per instruction.
+    n = len(mass)
+    for i in prange(n):
+        xi = x[i]
+        yi = y[i]
+        fx = np.float32(0.0)
+        fy = np.float32(0.0)
+        for j in range(n):
+            dx = x[j] - xi
+            dy = y[j] - yi
+
+            # Newton's Universal Law of Gravitation:
+            # https://phys.libretexts.org/Bookshelves/Conceptual_Physics/Introduction_to_Physics_(Park)/02%3A_Mechanics_I_-_Motion_and_Forces/02%3A_Dynamics/2.09%3A_Newtons_Universal_Law_of_Gravitation
+            # The force is resolved along `dx / r` and `dy / r`, which are the
+            # cosine and sine of the angle between the two bodies. Cubing the
+            # reciprocal square root gives r^-3 from r^2 with one square root
+            # and one division, which compiles to less than `r2 ** -1.5` does.
+            # Gravity is softened, so body `i` applies no force to itself.
+            inv_r = np.float32(1.0) / math.sqrt(dx * dx + dy * dy + soft2)
+            f = mass[j] * inv_r * inv_r * inv_r
+            fx += f * dx
+            fy += f * dy
+
+        force[i, 0] = G * mass[i] * fx
+        force[i, 1] = G * mass[i] * fy
+
+
+@functools.lru_cache(maxsize=None)
+def specialized_kernel(n: int):
+    """Returns a kernel with the same signature as `compute_forces` for exactly `n`
+    bodies, generated with every pair written out in full.
+
+    With no loops left, every position, mass and force is held in a local variable,
+    which removes the loop and parallel scheduling overhead that dominates when there
+    are only a handful of bodies. Each `n` is compiled once, on first use.
+    """
+    lines = [f"def kernel_{n}(pos, mass, G, soft2, force):"]
+    for i in range(n):
+        lines.append(f"    x{i} = pos[{i}, 0]")
+        lines.append(f"    y{i} = pos[{i}, 1]")
+        lines.append(f"    m{i} = mass[{i}]")
+        lines.append(f"    fx{i} = np.float32(0.0)")
+        lines.append(f"    fy{i} = np.float32(0.0)")
+    for i in range(n):
+        for j in range(i + 1, n):
+            lines.append(f"    dx = x{j} - x{i}")
+            lines.append(f"    dy = y{j} - y{i}")
+            lines.append(
+                "    inv_r = np.float32(1.0) / math.sqrt(dx * dx + dy * dy + soft2)"
+            )
+            lines.append(f"    f = m{i} * m{j} * inv_r * inv_r * inv_r")
+            lines.append(f"    fx{i} += f * dx")
+            lines.append(f"    fy{i} += f * dy")
+            lines.append(f"    fx{j} -= f * dx")
+            lines.append(f"    fy{j} -= f * dy")
+    for i in range(n):
+        lines.append(f"    force[{i}, 0] = G * fx{i}")
+        lines.append(f"    force[{i}, 1] = G * fy{i}")
+
+    namespace = {"math": math, "np": np}
+    exec("\n".join(lines), namespace)
+    return njit(fastmath=True)(namespace[f"kernel_{n}"])
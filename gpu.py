@@ -0,0 +1,101 @@
+"""A CUDA kernel that computes the force between every pair of bodies exactly on the
+GPU, for when there are too many bodies for the CPU kernels to keep up.
+
+Each thread computes the force on one body. The bodies are read a tile at a time into
+shared memory so that every thread in a block reads each body from fast on-chip
+memory rather than from global memory:
+https://developer.nvidia.com/gpugems/gpugems3/part-v-physics-simulation/chapter-31-fast-n-body-simulation-cuda
+"""
+
+import functools
+import math
+
+import numpy as np
+from numba import cuda, float32
+
+# The number of threads in a block, which is also the number of bodies in a tile.
+TILE_SIZE = 128
+
+
+def available() -> bool:
+    """Returns whether there is a CUDA device to run the kernel on."""
+    return cuda.is_available()
+
+
+def compute_forces(pos, mass, G, soft2, force):
+    """Writes the force applied to each body by every other body into `force`, with
+    the squared distance between each pair softened by `soft2`.
+
+    Only the positions and masses are copied to the device, and only the forces are
+    copied back. Every array and scalar must be `np.float32`, which consumer GPUs
+    compute many times faster than double precision.
+    """
+    n = len(mass)
+    # Round up to a power of two so that the device arrays are only reallocated when
+    # the number of bodies has doubled, not every time it changes.
+    d_pos, d_mass, d_force = _device_arrays(1 << (n - 1).bit_length())
+    d_pos = d_pos[:n]
+    d_mass = d_mass[:n]
+    d_force = d_force[:n]
+    d_pos.copy_to_device(pos)
+    d_mass.copy_to_device(mass)
+
+    blocks = (n + TILE_SIZE - 1) // TILE_SIZE
+    _compute_forces[blocks, TILE_SIZE](d_pos, d_mass, G, soft2, d_force)
+    d_force.copy_to_host(force)
+
+
+@functools.lru_cache(maxsize=1)
+def _device_arrays(capacity: int):
+    """Returns device arrays for the positions, masses and forces of up to `capacity`
+    bodies, which are kept between calls rather than allocated on every step.
+    """
+    return (
+        cuda.device_array((capacity, 2), dtype=np.float32),
+        cuda.device_array(capacity, dtype=np.float32),
+        cuda.device_array((capacity, 2), dtype=np.float32),
+    )
+
+
+@cuda.jit
+def _compute_forces(pos, mass, G, soft2, force):
+    tile = cuda.shared.array((TILE_SIZE, 3), float32)
+    n = mass.shape[0]
+    t = cuda.threadIdx.x
+    i = cuda.grid(1)
+
+    # Threads past the last body still load tiles for the rest of their block.
+    x = float32(0.0)
+    y = float32(0.0)
+    if i < n:
+        x = pos[i, 0]
+        y = pos[i, 1]
+    fx = float32(0.0)
+    fy = float32(0.0)
+
+    for start in range(0, n, TILE_SIZE):
+        j = start + t
+        if j < n:
+            tile[t, 0] = pos[j, 0]
+            tile[t, 1] = pos[j, 1]
+            tile[t, 2] = mass[j]
+        else:
+            # Padding with no mass applies no force.
+            tile[t, 0] = float32(0.0)
+            tile[t, 1] = float32(0.0)
+            tile[t, 2] = float32(0.0)
+        cuda.syncthreads()
+
+        # Gravity is softened, so body `i` applies no force to itself.
+        for k in range(TILE_SIZE):
+            dx = tile[k, 0] - x
+            dy = tile[k, 1] - y
+            inv_r = float32(1.0) / math.sqrt(dx * dx + dy * dy + soft2)
+            f = tile[k, 2] * inv_r * inv_r * inv_r
+            fx += f * dx
+            fy += f * dy
+        cuda.syncthreads()
+
+    if i < n:
+        force[i, 0] = G * mass[i] * fx
+        force[i, 1] = G * mass[i] * fy
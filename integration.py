@@ -0,0 +1,37 @@
+"""Compiled kernels that advance the velocity and position of every body in a single
+pass, without the temporary arrays the equivalent NumPy expressions allocate.
+"""
+
+from numba import njit
+
+
+@njit(fastmath=True, cache=True)
+def kick(vel, force, mass, timestep):
+    """Updates the velocity of each body from the force applied to it. Bodies without
+    mass are dead and are left with no acceleration.
+    """
+    for i in range(len(mass)):
+        if mass[i] > 0:
+            # a = F / m
+            # v2 = v1 + at
+            scale = timestep / mass[i]
+            vel[i, 0] += force[i, 0] * scale
+            vel[i, 1] += force[i, 1] * scale
+
+
+@njit(fastmath=True, cache=True)
+def kick_drift(pos, vel, force, mass, timestep, drift_timestep):
+    """Updates the velocity of each body by `timestep` and then its position by
+    `drift_timestep`, reading and writing each body once.
+    """
+    for i in range(len(mass)):
+        if mass[i] > 0:
+            # a = F / m
+            # v2 = v1 + at
+            scale = timestep / mass[i]
+            vel[i, 0] += force[i, 0] * scale
+            vel[i, 1] += force[i, 1] * scale
+
+        # s2 = s1 + vt
+        pos[i, 0] += vel[i, 0] * drift_timestep
+        pos[i, 1] += vel[i, 1] * drift_timestep
@@ -1,51 +1,47 @@
+import functools
 import math
 from random import randint, random, lognormvariate, normalvariate
 import sys
 
+import numpy as np
 import pygame
 import pygame.font
+import pygame.surfarray
 import pygame.time
 
-from body import Body
+from world import World
 
 
 def main() -> None:
-    def preset_momentum_demo() -> list["Body"]:
-        bodies = [
-            Body(
-                "red",
-                mass=10000,
-                position_x=(WINDOW_SIZE[0] / 2) - 100,
-                position_y=WINDOW_SIZE[1] / 2,
-                color=(255, 0, 0),
-                velocity_x=1,
-            ),
-            Body(
-                "blue",
-                mass=10,
-                position_x=(WINDOW_SIZE[0] / 2) + 100,
-                position_y=WINDOW_SIZE[1] / 2,
-                color=(0, 0, 255),
-            ),
-        ]
-        return bodies
-
-    def preset_random(body_count: int) -> list["Body"]:
-        bodies = [
-            Body(
-                i,
+    def preset_momentum_demo() -> World:
+        world = World(trail_length=FRAMERATE_MAX)
+        world.add_body(
+            mass=10000,
+            position_x=(WINDOW_SIZE[0] / 2) - 100,
+            position_y=WINDOW_SIZE[1] / 2,
+            color=(255, 0, 0),
+            velocity_x=1,
+        )
+        world.add_body(
+            mass=10,
+            position_x=(WINDOW_SIZE[0] / 2) + 100,
+            position_y=WINDOW_SIZE[1] / 2,
+            color=(0, 0, 255),
+        )
+        return world
+
+    def preset_random(body_count: int) -> World:
+        world = World(capacity=body_count, trail_length=FRAMERATE_MAX)
+        for _ in range(body_count):
+            world.add_body(
                 mass=randint(1, 100),
                 position_x=randint(0, WINDOW_SIZE[0]),
                 position_y=randint(0, WINDOW_SIZE[1]),
                 color=(randint(0, 255), randint(0, 255), randint(0, 255)),
             )
-            for i in range(body_count)
-        ]
-        return bodies
+        return world
 
-    def preset_circle(
-        body_count: int, velocity: int, radius: int, width: int
-    ) -> list["Body"]:
+    def preset_circle(body_count: int, velocity: int, radius: int, width: int) -> World:
         def generate_point_on_circle(
             velocity: int, radius: int, width: float
         ) -> tuple[float, float, float, float]:
@@ -54,56 +50,81 @@ def main() -> None:
 
             r = radius + width * random()
             theta = random() * 2 * math.pi
+            cos_theta = math.cos(theta)
+            sin_theta = math.sin(theta)
 
-            x = centre_x + r * math.cos(theta)
-            y = centre_y + r * math.sin(theta)
+            x = centre_x + r * cos_theta
+            y = centre_y + r * sin_theta
 
+            # The velocity is at a right angle to the radius, and rotating
+            # (cos, sin) by a right angle gives (-sin, cos).
             velocity = normalvariate(velocity, 4)
-            velocity_x = velocity * math.cos(theta + math.pi / 2)
-            velocity_y = velocity * math.sin(theta + math.pi / 2)
+            velocity_x = -velocity * sin_theta
+            velocity_y = velocity * cos_theta
             return x, y, velocity_x, velocity_y
 
-        bodies = []
-        bodies.append(
-            Body(
-                "centre",
-                mass=1000000,
-                position_x=WINDOW_SIZE[0] / 2,
-                position_y=WINDOW_SIZE[1] / 2,
-            )
+        world = World(capacity=body_count + 1, trail_length=FRAMERATE_MAX)
+        world.add_body(
+            mass=1000000,
+            position_x=WINDOW_SIZE[0] / 2,
+            position_y=WINDOW_SIZE[1] / 2,
         )
-        for i in range(body_count):
+        for _ in range(body_count):
             x, y, velocity_x, velocity_y = generate_point_on_circle(
                 velocity, radius, width
             )
-            bodies.append(
-                Body(
-                    i,
-                    mass=lognormvariate(2, 0.9),
-                    position_x=x,
-                    position_y=y,
-                    velocity_x=velocity_x,
-                    velocity_y=velocity_y,
-                    color=(randint(0, 255), randint(0, 255), randint(0, 255)),
-                )
+            world.add_body(
+                mass=lognormvariate(2, 0.9),
+                position_x=x,
+                position_y=y,
+                velocity_x=velocity_x,
+                velocity_y=velocity_y,
+                color=(randint(0, 255), randint(0, 255), randint(0, 255)),
             )
-        return bodies
+        return world
 
     WINDOW_SIZE = (1080, 1080)
     FRAMERATE_MAX = 120
 
+    # The simulation advances by `SIMULATION_SPEED` units of time per second of real
+    # time, in steps of `TIMESTEP` however fast frames are drawn. A frame that takes
+    # longer than `FRAMETIME_MAX` seconds is simulated as if it took that long, so
+    # that one slow frame cannot leave a backlog of steps that slows the next ones.
+    SIMULATION_SPEED = 12
+    TIMESTEP = 0.05
+    FRAMETIME_MAX = 0.25
+
     pygame.init()
     pygame.font.init()
     font_consolas = pygame.font.SysFont("Consolas", 20)
 
+    # Rendering text is slow and the values shown change rarely, so each rendered
+    # line is cached and reused until its value changes. Rendering onto the black
+    # background and converting to the window's pixel format gives an opaque surface
+    # that blits as a plain copy, rather than blending every pixel by its alpha.
+    @functools.lru_cache(maxsize=256)
+    def render_int(label: str, value: int, unit: str = "") -> pygame.Surface:
+        return font_consolas.render(
+            f"{label}: {value}{unit}", True, (255, 255, 255), (0, 0, 0)
+        ).convert()
+
     window = pygame.display.set_mode(WINDOW_SIZE)
     pygame.display.set_caption("Gravity Simulator")
 
     # Enter the preset you wish to use.
-    bodies: list["Body"] = preset_circle(25, 50, 250, 100)
+    world = preset_circle(25, 50, 250, 100)
+    # Compile any kernel specific to the preset now, rather than stalling a frame.
+    world.specialize()
 
     clock = pygame.time.Clock()
-    timestep = 0.1
+    # Simulated time that has passed but not yet been stepped through.
+    time_pending = 0.0
+
+    # The areas of the window drawn to in the previous frame. Only these need to be
+    # cleared and updated on screen, rather than the whole window, unless they add
+    # up to more than the window, when handling them one by one costs more.
+    dirty_rects: list[pygame.Rect] = []
+    window_area = WINDOW_SIZE[0] * WINDOW_SIZE[1]
 
     # Game loop.
     while True:
@@ -112,51 +133,93 @@ def main() -> None:
                 pygame.quit()
                 sys.exit()
 
-        window.fill((0, 0, 0))
+        # Move the bodies forward by as many timesteps as the time since the last
+        # frame covers, combining any that collide, and then update the trail of each
+        # body once per frame.
+        time_pending += min(clock.get_time() / 1000, FRAMETIME_MAX) * SIMULATION_SPEED
+        while time_pending >= TIMESTEP:
+            world.step(timestep=TIMESTEP)
+            time_pending -= TIMESTEP
+        world.update_trails()
+
+        full_redraw = sum(rect.w * rect.h for rect in dirty_rects) >= window_area
+        if full_redraw:
+            window.fill((0, 0, 0))
+        else:
+            for rect in dirty_rects:
+                window.fill((0, 0, 0), rect)
+        drawn_rects = []
+
+        # The pixel each body is drawn at, converted once for every body and shared by
+        # every kind of body drawn below.
+        screen_pos = world.pos.astype(np.int32)
+
+        # Draw every body that is no bigger than a pixel by writing its color
+        # straight into the window's pixels, all at once.
+        pixels = pygame.surfarray.pixels3d(window)
+        small = world.alive & (world.radius <= 1)
+        x, y = screen_pos[small].T
+        on_screen = (x >= 0) & (x < WINDOW_SIZE[0]) & (y >= 0) & (y < WINDOW_SIZE[1])
+        pixels[x[on_screen], y[on_screen]] = world.color[small][on_screen]
+        # Release the lock on the window so that it can be drawn to again.
+        del pixels
+        drawn_rects.extend(
+            pygame.Rect(pixel_x, pixel_y, 1, 1)
+            for pixel_x, pixel_y in zip(x[on_screen].tolist(), y[on_screen].tolist())
+        )
 
         # Draw the framerate, frametime, and the number of
         # bodies in the top-left corner of the window.
         framerate = clock.get_fps()
-        framerate_text = font_consolas.render(
-            f"Framerate: {int(framerate)} FPS", True, (255, 255, 255)
+        drawn_rects.append(
+            window.blit(render_int("Framerate", int(framerate), " FPS"), (10, 10))
         )
-        window.blit(framerate_text, (10, 10))
         frametime = clock.get_time()
-        frametime_text = font_consolas.render(
-            f"Frametime: {int(frametime)}ms", True, (255, 255, 255)
+        drawn_rects.append(
+            window.blit(render_int("Frametime", int(frametime), "ms"), (10, 30))
         )
-        window.blit(frametime_text, (10, 30))
-        bodies_text = font_consolas.render(
-            f"Bodies: {int(len(bodies))}", True, (255, 255, 255)
+        drawn_rects.append(
+            window.blit(render_int("Bodies", world.body_count), (10, 50))
         )
-        window.blit(bodies_text, (10, 50))
-
-        # Update the force applied to each body.
-        for body in bodies:
-            body.update_force(bodies)
-
-        # Update the position of the body and redraw.
-        for body in bodies:
-            # Update the position and trail.
-            body.update_position(timestep=timestep)
-            body.update_trail(framerate)
-
-            # Draw the body and trail.
-            pygame.draw.circle(
-                window,
-                body.color,
-                (body.position_x, body.position_y),
-                body.radius,
-            )
-            if len(body.trail) > 2:
-                pygame.draw.aalines(
-                    window,
-                    body.color,
-                    False,
-                    body.trail,
+
+        # Draw the remaining bodies. Each array is converted to Python numbers in one
+        # go, as pygame only accepts those, rather than indexing it body by body.
+        large = world.alive & ~small
+        for color, centre, radius in zip(
+            world.color[large].tolist(),
+            screen_pos[large].tolist(),
+            world.radius[large].tolist(),
+        ):
+            drawn_rects.append(pygame.draw.circle(window, color, centre, radius))
+
+        # Trails are kept in whole pixels and drawn without antialiasing, which is
+        # far cheaper and barely visible on moving bodies. Each trail is passed to
+        # pygame as the int32 array itself; converting it to a list first is no
+        # faster, as pygame still reads every point. Redrawing every trail costs less
+        # than fading a persistent trail surface, which touches every pixel of the
+        # window each frame and would defeat the dirty rectangles.
+        trails = world.get_trails()
+        trail_length = trails.shape[1]
+        # Trails are sliced by index, as selecting them with a mask would copy every
+        # trail out of the ring buffer.
+        has_trail = world.alive & (world.trail_count > 2)
+        for i, color, count in zip(
+            np.flatnonzero(has_trail).tolist(),
+            world.color[has_trail].tolist(),
+            world.trail_count[has_trail].tolist(),
+        ):
+            drawn_rects.append(
+                pygame.draw.lines(
+                    window, color, False, trails[i, trail_length - count :]
                 )
+            )
 
-        pygame.display.flip()
+        # Update what was drawn this frame and clear what was drawn last frame.
+        if full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty_rects + drawn_rects)
+        dirty_rects = drawn_rects
 
         clock.tick(FRAMERATE_MAX)
 
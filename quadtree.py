@@ -0,0 +1,307 @@
+"""A Barnes-Hut quadtree stored as flat arrays so that it can be built and traversed
+in compiled code.
+
+The tree groups bodies that are close together so that, when seen from far enough
+away, each group can be treated as a single body at the group's centre of mass. This
+reduces the force step from O(N^2) to O(N log N):
+https://en.wikipedia.org/wiki/Barnes%E2%80%93Hut_simulation
+"""
+
+import math
+
+import numpy as np
+from numba import njit
+
+# Bodies that still share a node at this depth are close enough to be treated as one.
+MAX_DEPTH = 32
+
+# Values of `body` for nodes that do not hold exactly one body.
+EMPTY = -1
+INTERNAL = -2
+
+
+@njit(cache=True)
+def _grow(child, body, centre_x, centre_y, size, mass, mass_x, mass_y):
+    """Returns copies of the node arrays with double the capacity."""
+    capacity = 2 * len(body)
+    count = len(body)
+
+    new_child = np.full((capacity, 4), EMPTY, dtype=np.int32)
+    new_child[:count] = child
+    new_body = np.full(capacity, EMPTY, dtype=np.int32)
+    new_body[:count] = body
+
+    new_centre_x = np.empty(capacity, dtype=np.float32)
+    new_centre_x[:count] = centre_x
+    new_centre_y = np.empty(capacity, dtype=np.float32)
+    new_centre_y[:count] = centre_y
+    new_size = np.empty(capacity, dtype=np.float32)
+    new_size[:count] = size
+
+    new_mass = np.zeros(capacity, dtype=np.float32)
+    new_mass[:count] = mass
+    new_mass_x = np.zeros(capacity, dtype=np.float32)
+    new_mass_x[:count] = mass_x
+    new_mass_y = np.zeros(capacity, dtype=np.float32)
+    new_mass_y[:count] = mass_y
+
+    return (
+        new_child,
+        new_body,
+        new_centre_x,
+        new_centre_y,
+        new_size,
+        new_mass,
+        new_mass_x,
+        new_mass_y,
+    )
+
+
+@njit(cache=True)
+def _add_child(node, x, y, c, child, centre_x, centre_y, size):
+    """Makes node `c` the child of `node` covering the quadrant containing (x, y)."""
+    right = x >= centre_x[node]
+    below = y >= centre_y[node]
+    offset = size[node] / 4
+    centre_x[c] = centre_x[node] + (offset if right else -offset)
+    centre_y[c] = centre_y[node] + (offset if below else -offset)
+    size[c] = size[node] / 2
+    child[node, right + 2 * below] = c
+
+
+@njit(cache=True)
+def build(pos, body_mass):
+    """Builds a quadtree containing every body with mass and returns it as the tuple
+    `(child, body, next_body, centre_x, centre_y, com_x, com_y, mass, size)`. Every
+    array but `next_body` is indexed by node, and the root is node 0.
+
+    `child[node, quadrant]` is the index of a child node or `EMPTY`, `body[node]` is
+    the index of the body held by a leaf (or `EMPTY`/`INTERNAL`), and `size[node]` is
+    the width of the square the node covers. A leaf at `MAX_DEPTH` can hold more than
+    one body, in which case `next_body` links each of its bodies to the next.
+    """
+    n = len(body_mass)
+    capacity = 4 * n + MAX_DEPTH + 2
+
+    child = np.full((capacity, 4), EMPTY, dtype=np.int32)
+    body = np.full(capacity, EMPTY, dtype=np.int32)
+    centre_x = np.empty(capacity, dtype=np.float32)
+    centre_y = np.empty(capacity, dtype=np.float32)
+    size = np.empty(capacity, dtype=np.float32)
+    mass = np.zeros(capacity, dtype=np.float32)
+    mass_x = np.zeros(capacity, dtype=np.float32)
+    mass_y = np.zeros(capacity, dtype=np.float32)
+    next_body = np.full(n, EMPTY, dtype=np.int32)
+
+    # The root is the smallest square containing every body.
+    min_x = pos[:, 0].min()
+    max_x = pos[:, 0].max()
+    min_y = pos[:, 1].min()
+    max_y = pos[:, 1].max()
+    centre_x[0] = (min_x + max_x) / 2
+    centre_y[0] = (min_y + max_y) / 2
+    size[0] = max(max_x - min_x, max_y - min_y) * np.float32(1.0001) + np.float32(1e-3)
+    count = 1
+
+    for b in range(n):
+        # Each insertion creates at most one node per level plus one.
+        if count + MAX_DEPTH + 2 > len(body):
+            (
+                child,
+                body,
+                centre_x,
+                centre_y,
+                size,
+                mass,
+                mass_x,
+                mass_y,
+            ) = _grow(child, body, centre_x, centre_y, size, mass, mass_x, mass_y)
+
+        # Bodies without mass apply no force, so they are left out of the tree.
+        m = body_mass[b]
+        if m == 0:
+            continue
+        x = pos[b, 0]
+        y = pos[b, 1]
+
+        node = 0
+        depth = 0
+        while True:
+            mass[node] += m
+            mass_x[node] += m * x
+            mass_y[node] += m * y
+
+            occupant = body[node]
+            if occupant == EMPTY:
+                body[node] = b
+                break
+            if occupant >= 0:
+                if depth >= MAX_DEPTH:
+                    next_body[b] = next_body[occupant]
+                    next_body[occupant] = b
+                    break
+
+                # Split the leaf by moving its body down into a new child.
+                body[node] = INTERNAL
+                ox = pos[occupant, 0]
+                oy = pos[occupant, 1]
+                c = count
+                count += 1
+                _add_child(node, ox, oy, c, child, centre_x, centre_y, size)
+                body[c] = occupant
+                mass[c] = body_mass[occupant]
+                mass_x[c] = body_mass[occupant] * ox
+                mass_y[c] = body_mass[occupant] * oy
+
+            quadrant = (x >= centre_x[node]) + 2 * (y >= centre_y[node])
+            c = child[node, quadrant]
+            if c == EMPTY:
+                c = count
+                count += 1
+                _add_child(node, x, y, c, child, centre_x, centre_y, size)
+            node = c
+            depth += 1
+
+    com_x = mass_x[:count] / mass[:count]
+    com_y = mass_y[:count] / mass[:count]
+    return (
+        child[:count],
+        body[:count],
+        next_body,
+        centre_x[:count],
+        centre_y[:count],
+        com_x,
+        com_y,
+        mass[:count],
+        size[:count],
+    )
+
+
+@njit(cache=True)
+def accumulate_forces(pos, body_mass, tree, theta, G, soft2, force):
+    """Writes the force applied to each body by every other body into `force`,
+    approximating each node whose `size / distance` is below `theta` as a single body
+    at its centre of mass. The squared distance to each node is softened by `soft2`.
+
+    Every array and scalar must be `np.float32`.
+    """
+    child, body, _, _, _, com_x, com_y, mass, size = tree
+    # A node is far enough away to be treated as one body when `size / r < theta`, or
+    # `size^2 / theta^2 < r^2`, the left of which is the same for every body.
+    open2 = size * size / (theta * theta)
+    stack = np.empty(3 * MAX_DEPTH + 4, dtype=np.int32)
+
+    for i in range(len(body_mass)):
+        x = pos[i, 0]
+        y = pos[i, 1]
+        fx = np.float32(0.0)
+        fy = np.float32(0.0)
+
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+            occupant = body[node]
+
+            # A body applies no force to itself. The centre of mass of its leaf is
+            # computed as `m * x / m`, which can differ from the body's position in
+            # the last bit, so the leaf must be skipped rather than relying on its
+            # distance being zero. The branch is taken once per body, so it is
+            # almost always predicted correctly.
+            if occupant == i:
+                continue
+
+            dx = com_x[node] - x
+            dy = com_y[node] - y
+            r2 = dx * dx + dy * dy
+            if occupant >= 0 or open2[node] < r2:
+                inv_r = np.float32(1.0) / math.sqrt(r2 + soft2)
+                f = mass[node] * inv_r * inv_r * inv_r
+                fx += f * dx
+                fy += f * dy
+            else:
+                for quadrant in range(4):
+                    c = child[node, quadrant]
+                    if c != EMPTY:
+                        stack[top] = c
+                        top += 1
+
+        force[i, 0] = G * body_mass[i] * fx
+        force[i, 1] = G * body_mass[i] * fy
+
+
+@njit(cache=True)
+def find_collisions(pos, radius, tree):
+    """Returns every pair of bodies in the tree that overlap as an array of `(i, j)`
+    rows with `i < j`.
+
+    Only the nodes that could hold a body overlapping body `i`, those within the sum
+    of its radius and the largest radius of any body in the node's square, are
+    searched.
+    """
+    child, body, next_body, centre_x, centre_y, _, _, _, size = tree
+    half_size = size / np.float32(2.0)
+
+    # The largest radius of any body in each node. Every child is created after its
+    # parent, so visiting the nodes in reverse finds each child's before its parent's.
+    node_radius = np.zeros(len(body), dtype=radius.dtype)
+    for node in range(len(body) - 1, -1, -1):
+        j = body[node]
+        if j == INTERNAL:
+            for quadrant in range(4):
+                c = child[node, quadrant]
+                if c != EMPTY:
+                    node_radius[node] = max(node_radius[node], node_radius[c])
+        while j >= 0:
+            node_radius[node] = max(node_radius[node], radius[j])
+            j = next_body[j]
+
+    stack = np.empty(3 * MAX_DEPTH + 4, dtype=np.int32)
+    pairs = []
+
+    for i in range(len(radius)):
+        # Dead bodies have no radius and collide with nothing.
+        if radius[i] == 0:
+            continue
+        x = pos[i, 0]
+        y = pos[i, 1]
+
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            node = stack[top]
+
+            # The distance from the body to the nearest point of the node's square,
+            # compared in squared space like every distance here, so no square root
+            # is needed to reject a node.
+            dx = max(abs(x - centre_x[node]) - half_size[node], np.float32(0.0))
+            dy = max(abs(y - centre_y[node]) - half_size[node], np.float32(0.0))
+            reach = radius[i] + node_radius[node]
+            if dx * dx + dy * dy > reach * reach:
+                continue
+
+            j = body[node]
+            if j == INTERNAL:
+                for quadrant in range(4):
+                    c = child[node, quadrant]
+                    if c != EMPTY:
+                        stack[top] = c
+                        top += 1
+                continue
+
+            while j >= 0:
+                if j > i:
+                    dx = pos[j, 0] - x
+                    dy = pos[j, 1] - y
+                    radius_sum = radius[i] + radius[j]
+                    if dx * dx + dy * dy < radius_sum * radius_sum:
+                        pairs.append((i, j))
+                j = next_body[j]
+
+    result = np.empty((len(pairs), 2), dtype=np.int64)
+    for k in range(len(pairs)):
+        result[k, 0] = pairs[k][0]
+        result[k, 1] = pairs[k][1]
+    return result
@@ -0,0 +1,450 @@
+import functools
+import math
+
+import numpy as np
+
+import forces
+import gpu
+import integration
+import quadtree
+
+# In our universe, G (gravitational constant) is equal to 6.67430e-11, but in this
+# simulation G can be set to different values to change the proportionality of the
+# force applied to each body.
+G = 1.0
+
+# Nodes of the Barnes-Hut quadtree whose width divided by their distance from a body
+# is below `BARNES_HUT_THETA` are treated as a single body. Lower values are more
+# accurate but slower. Below `BARNES_HUT_MIN_BODIES` the vectorized exact kernel is
+# faster than building and walking the tree, so every pair is computed exactly instead.
+BARNES_HUT_THETA = 0.5
+BARNES_HUT_MIN_BODIES = 8192
+
+# From `COLLISION_TREE_MIN_BODIES` bodies, overlapping bodies are found by searching a
+# quadtree rather than by testing every pair.
+COLLISION_TREE_MIN_BODIES = 64
+
+# From `GPU_MIN_BODIES` bodies, the exact force is computed on the GPU instead when
+# there is a CUDA device, which is faster than either kernel on the CPU.
+GPU_MIN_BODIES = 1024
+
+# With at most `SPECIALIZED_MAX_BODIES` bodies, `World.specialize` generates a kernel
+# for that exact number of bodies. Compiling it takes from about 0.3 s for two bodies
+# to 0.9 s for eight, and grows with the square of the number of bodies (about 9 s for
+# 26) while saving only a couple of microseconds per update, so larger worlds always
+# use the generic kernel.
+SPECIALIZED_MAX_BODIES = 8
+
+# The squared softening length never drops below this, which keeps it well clear of
+# the single precision denormal range.
+SOFTENING2_MIN = 1e-6
+
+
+class World:
+    """Holds every body in the simulation as parallel arrays so that the physics can
+    be computed for all bodies at once instead of one pair at a time.
+
+    The arrays are allocated with spare capacity so that adding a body is amortized
+    O(1); only the first `len(self)` rows are in use. A body that is combined into
+    another is marked as dead in `alive` and given no mass, rather than removed
+    straight away, and dead rows are compacted away once there are enough of them.
+    `body_count` is the number of bodies still alive.
+
+    Positions within a window and the masses used here need nothing like double
+    precision, so the arrays are single precision, which halves the memory traffic
+    of the force kernels and doubles the number of bodies per SIMD instruction. The
+    kernels work from the squared distance, which overflows single precision beyond
+    about 1.8e19 and loses precision long before that, so positions should stay in
+    units on the scale of the window; astronomical distances such as metres should
+    be rescaled before being added rather than the arrays widened. The trail of each
+    body is kept in a ring buffer of the last `trail_length` positions.
+    """
+
+    def __init__(self, capacity: int = 16, trail_length: int = 120):
+        self._count = 0
+        self._pos = np.empty((capacity, 2), dtype=np.float32)
+        self._vel = np.empty((capacity, 2), dtype=np.float32)
+        self._force = np.empty((capacity, 2), dtype=np.float32)
+        self._mass = np.empty(capacity, dtype=np.float32)
+        self._radius = np.empty(capacity, dtype=np.float32)
+        self._color = np.empty((capacity, 3), dtype=np.uint8)
+        self._alive = np.empty(capacity, dtype=bool)
+
+        # Every trail is written at the same `_trail_head` position each frame, so
+        # `_trail_count` only tracks how many of the positions are in use. Trails are
+        # only drawn, so each position is stored as whole pixels when it is added
+        # rather than every trail being converted every frame.
+        # Each position is written twice, `trail_length` apart, so that the last
+        # `trail_length` positions are always in order in one contiguous slice and
+        # reading a trail never has to copy it.
+        self._trail = np.empty((capacity, 2 * trail_length, 2), dtype=np.int32)
+        self._trail_count = np.zeros(capacity, dtype=np.int64)
+        self._trail_head = 0
+
+        # Values derived from the radii, which only change when a body is added or
+        # combined rather than every frame. Each is `None` until it is next needed.
+        # `_radius_sum2` has one entry per pair, in the order of `_pairs`.
+        self._radius_sum2 = None
+        self._soft2 = None
+
+        # Whether `force` is up to date with the current positions and masses.
+        self._force_current = False
+        # The kernel generated by `specialize` for the current number of rows, or
+        # `None` when the generic kernel is used.
+        self._specialized_kernel = None
+        # The quadtree built to find collisions, kept for the force update that
+        # follows when no bodies were combined. `None` when there is none to reuse.
+        self._tree = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def pos(self) -> np.ndarray:
+        return self._pos[: self._count]
+
+    @property
+    def vel(self) -> np.ndarray:
+        return self._vel[: self._count]
+
+    @property
+    def force(self) -> np.ndarray:
+        return self._force[: self._count]
+
+    @property
+    def mass(self) -> np.ndarray:
+        return self._mass[: self._count]
+
+    @property
+    def radius(self) -> np.ndarray:
+        return self._radius[: self._count]
+
+    @property
+    def color(self) -> np.ndarray:
+        return self._color[: self._count]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[: self._count]
+
+    @property
+    def body_count(self) -> int:
+        return int(self.alive.sum())
+
+    def add_body(
+        self,
+        mass: int | float,
+        position_x: int | float,
+        position_y: int | float,
+        velocity_x: int | float = 0,
+        velocity_y: int | float = 0,
+        color: tuple = (255, 255, 255),
+    ):
+        if self._count == len(self._mass):
+            self._grow()
+
+        i = self._count
+        self._pos[i] = (position_x, position_y)
+        self._vel[i] = (velocity_x, velocity_y)
+        self._force[i] = 0.0
+        self._mass[i] = mass
+        self._radius[i] = self._radius_of(mass)
+        self._color[i] = color
+        self._alive[i] = True
+        self._trail_count[i] = 0
+
+        self._count += 1
+        self._radii_changed()
+        self._force_current = False
+        self._tree = None
+        self._specialized_kernel = None
+        return self
+
+    def _grow(self):
+        """Doubles the capacity of every array."""
+        capacity = max(2 * len(self._mass), 1)
+        self._pos = np.resize(self._pos, (capacity, 2))
+        self._vel = np.resize(self._vel, (capacity, 2))
+        self._force = np.resize(self._force, (capacity, 2))
+        self._mass = np.resize(self._mass, capacity)
+        self._radius = np.resize(self._radius, capacity)
+        self._color = np.resize(self._color, (capacity, 3))
+        self._alive = np.resize(self._alive, capacity)
+        self._trail = np.resize(self._trail, (capacity, *self._trail.shape[1:]))
+        self._trail_count = np.resize(self._trail_count, capacity)
+        return self
+
+    def _compact(self, keep: np.ndarray):
+        """Removes every body whose entry in `keep` is false, preserving the order of
+        the remaining bodies.
+
+        Swapping the last body into each removed row would avoid moving the bodies in
+        between, but would reorder them, and bodies are merged in order of index.
+        Instead the rows to keep are found once and gathered from every array.
+        """
+        index = np.flatnonzero(keep)
+        count = len(index)
+        self._pos[:count] = self.pos[index]
+        self._vel[:count] = self.vel[index]
+        self._force[:count] = self.force[index]
+        self._mass[:count] = self.mass[index]
+        self._radius[:count] = self.radius[index]
+        self._color[:count] = self.color[index]
+        self._alive[:count] = self.alive[index]
+        self._trail[:count] = self._trail[index]
+        self._trail_count[:count] = self._trail_count[index]
+
+        self._count = count
+        self._radii_changed()
+        self._specialized_kernel = None
+        return self
+
+    @staticmethod
+    def _radius_of(mass: float | np.ndarray) -> float | np.ndarray:
+        # Using a combined formula for the volume of a sphere and the density.
+        density = 1.0
+        return np.cbrt((3 * mass) / (4 * math.pi * density))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _pairs(count: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the indices `(i, j)` of every pair of `count` bodies with `i < j`.
+
+        The distance between two bodies is the same either way round, so only the
+        upper triangle of the N x N matrix is needed.
+        """
+        return np.triu_indices(count, k=1)
+
+    def _distance2(self) -> np.ndarray:
+        """Returns the squared distance between the bodies of each pair in `_pairs`."""
+        i, j = self._pairs(len(self))
+        x = self.pos[:, 0]
+        y = self.pos[:, 1]
+        dx = x[j] - x[i]
+        dy = y[j] - y[i]
+
+        # Squaring and summing in place avoids allocating two more arrays.
+        dx *= dx
+        dy *= dy
+        dx += dy
+        return dx
+
+    def _radii_changed(self):
+        """Discards the values derived from the radii so that they are recomputed."""
+        self._radius_sum2 = None
+        self._soft2 = None
+        return self
+
+    def _softening(self) -> np.float32:
+        """Returns the square of the length by which gravity is softened.
+
+        Softening replaces r^2 with r^2 + soft^2 in the force, which keeps the force
+        finite however close two bodies get. The force kernels can then run without
+        branching on collisions, which are handled in a separate pass. Softening by
+        the diameter of the smallest body only affects bodies that are about to
+        collide.
+        """
+        if self._soft2 is None:
+            soft2 = float(2 * self.radius[self.alive].min()) ** 2
+            self._soft2 = np.float32(max(soft2, SOFTENING2_MIN))
+        return self._soft2
+
+    def update_forces(self):
+        """Updates the force applied to each body by every other body."""
+        self._force_current = True
+        # Any quadtree left by `handle_collisions` is only valid until the bodies
+        # next move, which is after this update.
+        tree = self._tree
+        self._tree = None
+        if self.body_count == 0:
+            return self
+        if len(self) >= GPU_MIN_BODIES and gpu.available():
+            gpu.compute_forces(
+                self.pos, self.mass, np.float32(G), self._softening(), self.force
+            )
+            return self
+        if len(self) < BARNES_HUT_MIN_BODIES:
+            return self._update_forces_exact()
+
+        if tree is None:
+            tree = quadtree.build(self.pos, self.mass)
+        quadtree.accumulate_forces(
+            self.pos,
+            self.mass,
+            tree,
+            np.float32(BARNES_HUT_THETA),
+            np.float32(G),
+            self._softening(),
+            self.force,
+        )
+        return self
+
+    def _update_forces_exact(self):
+        """Updates the force applied to each body by summing the force from every
+        other body.
+        """
+        compute_forces = self._specialized_kernel or forces.compute_forces
+        compute_forces(
+            self.pos, self.mass, np.float32(G), self._softening(), self.force
+        )
+        return self
+
+    def specialize(self):
+        """Generates and compiles a kernel for the current number of bodies, which
+        is then used to compute the force until a body is added or the arrays are
+        compacted. Compiling takes a moment, so this should be called before the
+        simulation starts rather than during it.
+
+        Combining bodies leaves dead rows rather than changing the number of rows, so
+        the kernel stays in use through collisions until enough have happened to
+        compact the arrays.
+        """
+        if 0 < len(self) <= SPECIALIZED_MAX_BODIES:
+            self._specialized_kernel = forces.specialized_kernel(len(self))
+            # The kernel is compiled on its first call.
+            self.update_forces()
+        return self
+
+    def _get_radius_sum2(self) -> np.ndarray:
+        """Returns the square of the sum of the radii of the bodies of each pair in
+        `_pairs`.
+        """
+        if self._radius_sum2 is None:
+            i, j = self._pairs(len(self))
+            radius = self.radius
+            self._radius_sum2 = (radius[i] + radius[j]) ** 2
+        return self._radius_sum2
+
+    def handle_collisions(self):
+        """Combines every pair of bodies that overlap, and compacts the arrays once
+        more than a quarter of the rows belong to dead bodies.
+        """
+        if len(self) < COLLISION_TREE_MIN_BODIES:
+            i, j = self._pairs(len(self))
+            overlap = self._distance2() < self._get_radius_sum2()
+            pairs = np.column_stack((i[overlap], j[overlap]))
+        else:
+            # Only bodies in nearby nodes of the quadtree can overlap, which avoids
+            # the N x N distance matrix.
+            self._tree = quadtree.build(self.pos, self.mass)
+            pairs = quadtree.find_collisions(self.pos, self.radius, self._tree)
+        if len(pairs) == 0:
+            return self
+
+        # Every pair is of two different bodies, so the only check needed is that
+        # neither has already been combined into another. The pairs are converted to
+        # Python ints at once rather than unpacked into NumPy scalars pair by pair.
+        alive = self.alive
+        for i, j in pairs.tolist():
+            if alive[i] and alive[j]:
+                self.combine(i, j)
+
+        if self.body_count < 0.75 * len(self):
+            # `alive` is a view of the array being compacted, so pass a copy.
+            self._compact(self.alive.copy())
+        return self
+
+    def combine(self, i: int, j: int):
+        """Combines body `j` into body `i` and marks body `j` as dead."""
+        # The arrays are single precision, so the weighted averages are computed in
+        # double precision to keep merging a small body into a large one accurate.
+        mass = self.mass
+        mass_i = float(mass[i])
+        mass_j = float(mass[j])
+        total = mass_i + mass_j
+
+        # Combine position.
+        pos = self.pos
+        pos[i] = (
+            pos[i].astype(np.float64) * mass_i + pos[j].astype(np.float64) * mass_j
+        ) / total
+
+        # Combine momentum and update velocity.
+        vel = self.vel
+        vel[i] = (
+            vel[i].astype(np.float64) * mass_i + vel[j].astype(np.float64) * mass_j
+        ) / total
+
+        # Combine mass. The density is the same for every body, so the combined
+        # volume, and so the cube of the radius, is the sum of the two.
+        mass[i] = total
+        radius = self.radius
+        radius[i] = math.cbrt(float(radius[i]) ** 3 + float(radius[j]) ** 3)
+        self._radii_changed()
+        self._tree = None
+
+        # Combine colors. The channels are widened so that their sum cannot overflow a
+        # byte before it is halved.
+        color = self.color
+        color[i] = (color[i].astype(np.uint16) + color[j]) // 2
+
+        # Reset trail.
+        self._trail_count[i] = 0
+
+        # Remove body `j`. With no mass it no longer attracts or collides with
+        # anything, so the force kernels need no check for dead bodies.
+        self.alive[j] = False
+        mass[j] = 0.0
+        self.radius[j] = 0.0
+        vel[j] = 0.0
+        return self
+
+    def step(self, timestep: float = 1.0):
+        """Advances the simulation by `timestep` using kick-drift-kick leapfrog
+        integration, which is second order accurate, unlike Euler integration, for
+        the same single force update per step:
+        https://en.wikipedia.org/wiki/Leapfrog_integration
+        """
+        if not self._force_current:
+            self.update_forces()
+
+        # Kick by half a timestep and drift by a whole one, then update the forces
+        # for the new positions and kick by the other half.
+        half_timestep = np.float32(timestep / 2)
+        integration.kick_drift(
+            self.pos,
+            self.vel,
+            self.force,
+            self.mass,
+            half_timestep,
+            np.float32(timestep),
+        )
+        self._force_current = False
+        self.handle_collisions()
+        self.update_forces()
+        integration.kick(self.vel, self.force, self.mass, half_timestep)
+        return self
+
+    def update_trails(self):
+        """Adds the current position of each body, truncated to whole pixels, to its
+        trail, overwriting the oldest position once the trail is full.
+        """
+        trail_length = self._trail.shape[1] // 2
+        count = self._count
+        head = self._trail_head
+
+        pos = self.pos.astype(np.int32)
+        self._trail[:count, head] = pos
+        self._trail[:count, head + trail_length] = pos
+        np.minimum(
+            self._trail_count[:count] + 1,
+            trail_length,
+            out=self._trail_count[:count],
+        )
+        self._trail_head = (head + 1) % trail_length
+        return self
+
+    @property
+    def trail_count(self) -> np.ndarray:
+        return self._trail_count[: self._count]
+
+    def get_trails(self) -> np.ndarray:
+        """Returns the trail of every body from its oldest to its newest position, in
+        whole pixels. Only the last `trail_count[i]` positions of trail `i` are in use.
+
+        The trails are a view of the ring buffer, so they are only valid until the next
+        call to `update_trails`.
+        """
+        trail_length = self._trail.shape[1] // 2
+        head = self._trail_head
+        return self._trail[: self._count, head : head + trail_length]